@@ -125,9 +125,11 @@ def interactive_mode():
             if not query:
                 continue
             
-            print("Processing...")
-            response = legal_ai.query(query)
-            print(f"\nAnswer: {response}")
+            # Print tokens as they arrive instead of waiting for the full answer
+            print("\nAnswer: ", end="", flush=True)
+            for token in legal_ai.query(query, stream=True):
+                print(token, end="", flush=True)
+            print()
             
         except KeyboardInterrupt:
             print("\nGoodbye!")
@@ -2,12 +2,26 @@
 Legal-AI: Government Document Analysis with RAG
 """
 
+import importlib
+from typing import TYPE_CHECKING
+
 __version__ = "1.0.0"
 __author__ = "Legal-AI Team"
 
-from .parsers import GovInfoParser, DocumentParser
-from .rag import RAGSystem, LegalRAG
-from .core import LegalAI
+# Public classes and their modules; imported on first access (PEP 562) so
+# that e.g. legal_ai.cache does not pull in llama_index
+_EXPORTS = {
+    "GovInfoParser": ".parsers",
+    "DocumentParser": ".parsers",
+    "RAGSystem": ".rag",
+    "LegalRAG": ".rag",
+    "LegalAI": ".core",
+}
+
+if TYPE_CHECKING:
+    from .parsers import GovInfoParser, DocumentParser
+    from .rag import RAGSystem, LegalRAG
+    from .core import LegalAI
 
 __all__ = [
     "GovInfoParser",
@@ -16,3 +30,18 @@ __all__ = [
     "LegalRAG",
     "LegalAI"
 ]
+
+
+def __getattr__(name: str):
+    """Import a public class on first access"""
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,105 @@
+"""
+Legal content classification and entity extraction
+"""
+
+import re
+import threading
+from typing import List, Optional, Tuple
+
+try:
+    import hyperscan
+except ImportError:  # optional multi-pattern scanner
+    hyperscan = None
+
+
+# Legal entity patterns; kept separate so each scan can use its literal prefix
+_SECTION_RE = re.compile(r'Section \d+', re.IGNORECASE)
+_AMOUNT_RE = re.compile(r'\$[\d,]+(?:\.\d{2})?')
+
+# Legal content categories in priority order with their lowercase keywords.
+# "subsection" is covered by "section", so it needs no probe of its own.
+_LEGAL_CATEGORY_KEYWORDS = (
+    ("structured_legal_text", ("section", "paragraph")),
+    ("budget_document", ("budget", "appropriation", "funding")),
+    ("legislative_text", ("whereas", "resolved", "enacted")),
+)
+
+
+# Category priority of each keyword, in the order they are given to hyperscan
+_KEYWORD_PRIORITIES = [
+    priority
+    for priority, (_, keywords) in enumerate(_LEGAL_CATEGORY_KEYWORDS)
+    for _ in keywords
+]
+
+# Scratch space is per thread, since one cannot be shared by concurrent scans
+_HYPERSCAN_LOCAL = threading.local()
+
+
+def _compile_keyword_database() -> Optional["hyperscan.Database"]:
+    """Compile every category keyword into one caseless hyperscan database"""
+    if hyperscan is None:
+        return None
+    
+    keywords = [keyword.encode() for _, keywords in _LEGAL_CATEGORY_KEYWORDS for keyword in keywords]
+    database = hyperscan.Database()
+    database.compile(
+        expressions=keywords,
+        ids=list(range(len(keywords))),
+        elements=len(keywords),
+        flags=hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+    )
+    return database
+
+
+_KEYWORD_DATABASE = _compile_keyword_database()
+
+
+def _classify_with_hyperscan(text: str) -> str:
+    """Find the highest-priority category in one scan over the text"""
+    scratch = getattr(_HYPERSCAN_LOCAL, "scratch", None)
+    if scratch is None:
+        scratch = _HYPERSCAN_LOCAL.scratch = hyperscan.Scratch(_KEYWORD_DATABASE)
+    
+    best = [len(_LEGAL_CATEGORY_KEYWORDS)]
+    
+    def on_match(keyword_id, start, end, flags, context):
+        best[0] = min(best[0], _KEYWORD_PRIORITIES[keyword_id])
+        # Nothing can outrank the first category, so stop scanning
+        return best[0] == 0
+    
+    try:
+        _KEYWORD_DATABASE.scan(text.encode("utf-8"), match_event_handler=on_match, scratch=scratch)
+    except hyperscan.ScanTerminated:
+        pass
+    
+    if best[0] < len(_LEGAL_CATEGORY_KEYWORDS):
+        return _LEGAL_CATEGORY_KEYWORDS[best[0]][0]
+    return "general_legal"
+
+
+def classify_legal_content(text: str) -> str:
+    """Classify the type of legal content"""
+    if _KEYWORD_DATABASE is not None:
+        return _classify_with_hyperscan(text)
+    
+    text_lower = text.lower()
+    
+    for category, keywords in _LEGAL_CATEGORY_KEYWORDS:
+        for keyword in keywords:
+            if keyword in text_lower:
+                return category
+    
+    return "general_legal"
+
+
+def extract_legal_entities(text: str) -> List[str]:
+    """Extract legal entities from text (simplified implementation)"""
+    # This is a basic implementation - in practice you'd use NER
+    # Unique section references followed by dollar amounts
+    return list(dict.fromkeys(_SECTION_RE.findall(text) + _AMOUNT_RE.findall(text)))
+
+
+def analyze_legal_text(text: str) -> Tuple[str, List[str]]:
+    """Classify text and extract its entities (module level so it can be pickled)"""
+    return classify_legal_content(text), extract_legal_entities(text)
@@ -0,0 +1,242 @@
+"""
+Disk-backed caching for fetched government documents
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import diskcache
+import numpy as np
+from loguru import logger
+
+
+DEFAULT_CACHE_DIR = "~/.cache/legal_ai"
+
+_SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def parse_size(size: Union[int, str]) -> int:
+    """Convert a size such as 1048576 or "1GB" into bytes"""
+    if isinstance(size, int):
+        return size
+    
+    size = size.strip().upper()
+    for unit, factor in _SIZE_UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def content_signature(texts: Iterable[str], *settings: Any) -> str:
+    """Stable digest of document texts and the settings they were processed with"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x1e")
+    for setting in settings:
+        digest.update(repr(setting).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class DocumentCache:
+    """Disk cache for fetched HTML and parsed document chunks"""
+    
+    def __init__(self, cache_dir: str = None, ttl: Optional[int] = 3600, size_limit: Union[int, str] = "1GB"):
+        self.cache_dir = os.path.expanduser(cache_dir or os.getenv("CACHE_DIR", DEFAULT_CACHE_DIR))
+        self.ttl = ttl
+        self.cache = diskcache.Cache(self.cache_dir, size_limit=parse_size(size_limit))
+        logger.debug(f"Document cache at {self.cache_dir}")
+    
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional["DocumentCache"]:
+        """Create a cache from the ``cache`` config section, or None when disabled"""
+        cache_config = config.get("cache", {})
+        if not cache_config.get("enabled", False):
+            return None
+        
+        return cls(
+            cache_dir=cache_config.get("directory"),
+            ttl=cache_config.get("ttl", 3600),
+            size_limit=cache_config.get("max_size", "1GB")
+        )
+    
+    @staticmethod
+    def make_key(namespace: str, *parts: Any) -> str:
+        """Build a key from a namespace and a SHA-256 digest of the parts"""
+        digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+        return f"{namespace}:{digest}"
+    
+    def get(self, key: str) -> Any:
+        """Return a cached value, or None on a miss"""
+        return self.cache.get(key)
+    
+    def set(self, key: str, value: Any) -> None:
+        """Store a value for the configured TTL"""
+        self.cache.set(key, value, expire=self.ttl)
+    
+    def get_html(self, url: str) -> Optional[str]:
+        """Return cached HTML for a URL, or None on a miss"""
+        compressed = self.get(self.make_key("html", url))
+        if compressed is None:
+            return None
+        return gzip.decompress(compressed).decode("utf-8")
+    
+    def set_html(self, url: str, html: str) -> None:
+        """Store gzip-compressed HTML for a URL"""
+        self.set(self.make_key("html", url), gzip.compress(html.encode("utf-8")))
+    
+    def clear(self) -> None:
+        """Remove every cached entry"""
+        self.cache.clear()
+
+
+class SemanticCache:
+    """Cache answering near-duplicate queries by embedding similarity
+    
+    Entries live in memory and, when a DocumentCache store is given, are
+    written through to disk so they survive restarts. Each entry has its own
+    store key, numbered per namespace, so an add writes one entry rather than
+    the whole namespace.
+    """
+    
+    def __init__(self, threshold: float = 0.95, ttl: Optional[int] = 3600, max_entries: int = 1024,
+                 store: Optional[DocumentCache] = None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, Dict] = {}
+    
+    def lookup(self, embedding: List[float], namespace: str = "default") -> Optional[str]:
+        """Return the answer of the most similar cached query above the threshold"""
+        with self._lock:
+            entries = self._entries(namespace)
+            if not entries:
+                return None
+            
+            self._expire(entries)
+            if not entries["answers"]:
+                return None
+            
+            if entries["matrix"] is None:
+                entries["matrix"] = np.vstack(entries["vectors"])
+            similarities = entries["matrix"] @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            return entries["answers"][best]
+    
+    def add(self, embedding: List[float], answer: str, namespace: str = "default") -> None:
+        """Cache the answer for a query embedding"""
+        with self._lock:
+            entries = self._entries(namespace)
+            if entries is None:
+                entries = self._namespaces[namespace] = self._new_entries(namespace)
+            vector = self._normalize(embedding)
+            created = time.time()
+            sequence = entries["next"]
+            entries["next"] += 1
+            entries["vectors"].append(vector)
+            entries["answers"].append(answer)
+            entries["created"].append(created)
+            entries["sequences"].append(sequence)
+            entries["matrix"] = None
+            
+            if len(entries["answers"]) > self.max_entries:
+                self._drop(entries, len(entries["answers"]) - self.max_entries)
+            
+            if self.store is not None:
+                self.store.set(self._entry_key(namespace, sequence), (vector, answer, created))
+                first = entries["sequences"][0] if entries["sequences"] else entries["next"]
+                self.store.set(self._store_key(namespace), {"first": first, "next": entries["next"]})
+    
+    def clear(self, namespace: str = None) -> None:
+        """Drop one namespace, or every cached query"""
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+                keys = [] if self.store is None else [
+                    key for key in self.store.cache.iterkeys() if key.startswith("semantic:")
+                ]
+            else:
+                self._namespaces.pop(namespace, None)
+                keys = []
+                if self.store is not None:
+                    position = self.store.get(self._store_key(namespace))
+                    if position is not None:
+                        keys = [self._entry_key(namespace, sequence)
+                                for sequence in range(position["first"], position["next"])]
+                    keys.append(self._store_key(namespace))
+            for key in keys:
+                self.store.cache.delete(key)
+    
+    @staticmethod
+    def _new_entries(namespace: str, next_sequence: int = 0) -> Dict:
+        """Empty entries of a namespace, numbering new entries from next_sequence"""
+        return {
+            "namespace": namespace, "vectors": [], "answers": [], "created": [], "sequences": [],
+            "next": next_sequence, "matrix": None
+        }
+    
+    def _entries(self, namespace: str) -> Optional[Dict]:
+        """Return a namespace's entries, loading them from the store on first use"""
+        entries = self._namespaces.get(namespace)
+        if entries is None and self.store is not None:
+            position = self.store.get(self._store_key(namespace))
+            if position is not None:
+                entries = self._namespaces[namespace] = self._new_entries(namespace, position["next"])
+                for sequence in range(position["first"], position["next"]):
+                    stored = self.store.get(self._entry_key(namespace, sequence))
+                    if stored is None:
+                        # Expired or evicted by the store
+                        continue
+                    for key, value in zip(("vectors", "answers", "created"), stored):
+                        entries[key].append(value)
+                    entries["sequences"].append(sequence)
+        return entries
+    
+    @staticmethod
+    def _store_key(namespace: str) -> str:
+        """Store key for the range of a namespace's entry numbers"""
+        return DocumentCache.make_key("semantic", namespace)
+    
+    @staticmethod
+    def _entry_key(namespace: str, sequence: int) -> str:
+        """Store key for one entry of a namespace"""
+        return DocumentCache.make_key("semantic", namespace, sequence)
+    
+    def _expire(self, entries: Dict) -> None:
+        """Drop entries older than the TTL (oldest entries come first)"""
+        if self.ttl is None:
+            return
+        
+        cutoff = time.time() - self.ttl
+        expired = 0
+        for created in entries["created"]:
+            if created >= cutoff:
+                break
+            expired += 1
+        if expired:
+            self._drop(entries, expired)
+    
+    def _drop(self, entries: Dict, count: int) -> None:
+        """Drop the oldest ``count`` entries"""
+        if self.store is not None:
+            for sequence in entries["sequences"][:count]:
+                self.store.cache.delete(self._entry_key(entries["namespace"], sequence))
+        for key in ("vectors", "answers", "created", "sequences"):
+            del entries[key][:count]
+        entries["matrix"] = None
+    
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        """Return the embedding as a unit-length float32 vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
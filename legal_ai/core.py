@@ -2,28 +2,64 @@
 Core Legal-AI implementation
 """
 
+import copy
+import functools
 import os
+import shutil
 import yaml
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Dict, Optional, Union
 from dotenv import load_dotenv
 from loguru import logger
 
+from .cache import content_signature
 from .parsers import GovInfoParser
 from .rag import LegalRAG
 
 
+# Prefer the libyaml C loader when PyYAML was built with it
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_DOTENV_LOADED = False
+
+# Chunk metadata LegalRAG derives from the text while building the index
+_DERIVED_METADATA = ("legal_category", "legal_entities")
+
+
+def _load_dotenv_once():
+    """Load the .env file the first time a LegalAI instance is created"""
+    global _DOTENV_LOADED
+    if not _DOTENV_LOADED:
+        load_dotenv()
+        _DOTENV_LOADED = True
+
+
+@functools.lru_cache(maxsize=8)
+def _load_config_cached(config_path: str, mtime: float) -> Dict:
+    """Parse a YAML config file; cached until the file's mtime changes"""
+    with open(config_path, 'r') as file:
+        return yaml.load(file, Loader=_YamlLoader)
+
+
 class LegalAI:
     """Main Legal-AI class for document analysis and RAG operations"""
     
     def __init__(self, config_path: str = "config.yaml"):
         """Initialize Legal-AI system"""
-        load_dotenv()
+        _load_dotenv_once()
         self.config = self._load_config(config_path)
         self.parser = GovInfoParser(self.config)
-        self.rag = LegalRAG(self.config)
+        self.rag = LegalRAG(self.config, cache=self.parser.cache)
         self.documents = []
         self.index = None
         
+        # Reopen the persistent corpus index, if one is configured and saved
+        corpus_dir = self._corpus_dir()
+        if corpus_dir:
+            self.rag.recover_persisted_index(corpus_dir)
+            if os.path.isdir(corpus_dir):
+                self.index = self.rag.load_index(corpus_dir)
+        
         # Setup logging
         self._setup_logging()
         logger.info("Legal-AI system initialized")
@@ -31,8 +67,10 @@ class LegalAI:
     def _load_config(self, config_path: str) -> Dict:
         """Load configuration from YAML file"""
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            config_path = os.path.abspath(config_path)
+            config = _load_config_cached(config_path, os.path.getmtime(config_path))
+            # Hand out a copy so instances can't modify the cached parse
+            return copy.deepcopy(config)
         except FileNotFoundError:
             logger.warning(f"Config file {config_path} not found, using defaults")
             return self._default_config()
@@ -73,35 +111,141 @@ class LegalAI:
         except Exception as e:
             logger.error(f"Failed to load document: {e}")
             raise
+        
+        self._add_to_corpus(documents)
     
     def load_documents(self, urls: List[str]) -> None:
-        """Load and parse multiple government documents"""
+        """Load and parse multiple government documents concurrently"""
         logger.info(f"Loading {len(urls)} documents")
-        for url in urls:
-            self.load_document(url)
+        if not urls:
+            return
+        
+        max_workers = self.config.get("document_processing", {}).get("max_workers", 8)
+        loaded = []
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+                futures = [executor.submit(self.parser.parse_govinfo_document, url) for url in urls]
+                for url, future in zip(urls, futures):
+                    try:
+                        documents = future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to load document {url}: {e}")
+                        # Don't fetch the URLs still queued when the executor shuts down
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+                    self.documents.extend(documents)
+                    loaded.extend(documents)
+                    logger.info(f"Successfully loaded {len(documents)} document chunks from {url}")
+        finally:
+            # Chunks loaded before a failure are kept in the corpus too
+            self._add_to_corpus(loaded)
+    
+    def _corpus_dir(self) -> Optional[str]:
+        """Directory of the configured persistent corpus index, if any"""
+        persist_dir = self.config.get("llama_index", {}).get("persist_dir")
+        return os.path.expanduser(persist_dir) if persist_dir else None
+    
+    def _add_to_corpus(self, documents: List) -> None:
+        """Insert new chunks into an open corpus index and save it"""
+        corpus_dir = self._corpus_dir()
+        if not corpus_dir or self.index is None or not documents:
+            return
+        
+        if self.rag.insert_documents(documents):
+            self.rag.persist_index(corpus_dir, overwrite=True)
     
     def build_index(self) -> None:
         """Build the RAG index from loaded documents"""
+        if self.index is not None and self._corpus_dir():
+            # The corpus index already holds every loaded document
+            return
+        
         if not self.documents:
             raise ValueError("No documents loaded. Load documents first.")
         
+        persist_dir = self._index_persist_dir()
+        if persist_dir and os.path.isdir(persist_dir):
+            logger.info("Loading persisted RAG index...")
+            self.index = self.rag.load_index(persist_dir)
+            if not self._corpus_dir():
+                # Mark it recently used for _prune_index_cache
+                os.utime(persist_dir)
+            return
+        
         logger.info("Building RAG index...")
         self.index = self.rag.build_index(self.documents)
         logger.info("RAG index built successfully")
+        
+        if persist_dir:
+            self.rag.persist_index(persist_dir)
+            if not self._corpus_dir():
+                self._prune_index_cache(persist_dir)
+    
+    def _index_persist_dir(self) -> Optional[str]:
+        """Directory holding the persisted index for the loaded documents.
+        
+        A configured corpus directory is used as is. Otherwise returns None when
+        caching is disabled; the directory name is a digest of the chunk texts,
+        metadata and index settings, so any change triggers a rebuild.
+        """
+        if self._corpus_dir():
+            return self._corpus_dir()
+        
+        if self.parser.cache is None:
+            return None
+        
+        # Metadata is embedded and stored with each node, so it is part of the identity
+        signature = content_signature(
+            (
+                repr((doc.text, {
+                    key: value for key, value in doc.metadata.items() if key not in _DERIVED_METADATA
+                }))
+                for doc in self.documents
+            ),
+            self.config.get("llama_index", {})
+        )
+        return os.path.join(self.parser.cache.cache_dir, "index", signature[:16])
+    
+    def _prune_index_cache(self, current_dir: str) -> None:
+        """Keep the current and the most recently used persisted indexes, up to cache.max_indexes"""
+        max_indexes = self.config.get("cache", {}).get("max_indexes", 4)
+        # Staging and retired directories of persist_index carry a dotted suffix
+        index_dirs = [
+            entry.path for entry in os.scandir(os.path.dirname(current_dir))
+            if entry.is_dir() and "." not in entry.name and entry.path != current_dir
+        ]
+        index_dirs.sort(key=os.path.getmtime, reverse=True)
+        for index_dir in index_dirs[max(max_indexes - 1, 0):]:
+            logger.info(f"Removing least recently used index {index_dir}")
+            shutil.rmtree(index_dir, ignore_errors=True)
     
-    def query(self, question: str) -> str:
-        """Query the RAG system"""
+    def query(self, question: str, stream: bool = False) -> Union[str, Iterator[str]]:
+        """Query the RAG system, optionally streaming the answer token by token"""
         if self.index is None:
             self.build_index()
         
         logger.info(f"Processing query: {question}")
         try:
-            response = self.rag.query(question, self.index)
-            logger.info("Query processed successfully")
-            return response
+            response = self.rag.query(question, self.index, stream=stream)
+        except Exception as e:
+            logger.error(f"Query failed: {e}")
+            raise
+        
+        if stream:
+            # Tokens are generated, and can fail, only as the caller reads them
+            return self._log_stream(response)
+        logger.info("Query processed successfully")
+        return response
+    
+    def _log_stream(self, tokens: Iterator[str]) -> Iterator[str]:
+        """Yield streamed tokens, logging the outcome once the stream ends"""
+        try:
+            yield from tokens
         except Exception as e:
             logger.error(f"Query failed: {e}")
             raise
+        logger.info("Query processed successfully")
     
     def compare_documents(self, query: str) -> str:
         """Compare loaded documents based on a query"""
@@ -2,14 +2,142 @@
 Document parsers for government documents from govinfo.gov
 """
 
+import asyncio
+import email.message
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
-from typing import List, Dict, Optional
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Union
 from urllib.parse import urljoin, urlparse
 from loguru import logger
-from llama_index import Document
-import html2text
+from lxml import etree
+import lxml.html
+
+from . import __version__
+from .analysis import analyze_legal_text
+from .cache import DocumentCache
+
+if TYPE_CHECKING:
+    import aiohttp
+    from llama_index import Document
+
+
+# Shared libxml2 HTML parser; content is always handed over as UTF-8 bytes.
+# huge_tree lifts libxml2's size and depth limits, which otherwise silently
+# yield an empty tree for large bills or deeply nested markup.
+_HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8", huge_tree=True)
+
+# Stand-in for empty or whitespace-only documents
+_EMPTY_HTML = b"<html><body></body></html>"
+
+# Bytes read from the network per parser feed when streaming documents
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Elements that end a line when HTML is flattened to text
+_BLOCK_TAGS = (
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+    "tr", "ul",
+)
+
+# Flattens a tree to text inside libxslt: block elements end a line, table
+# cells are space separated and script/style content is dropped
+_TEXT_XSLT = etree.XSLT(etree.XML(f"""
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:output method="text" encoding="UTF-8"/>
+  <xsl:template match="script|style"/>
+  <xsl:template match="{'|'.join(_BLOCK_TAGS)}">
+    <xsl:apply-templates/>
+    <xsl:text>&#10;</xsl:text>
+  </xsl:template>
+  <xsl:template match="td|th">
+    <xsl:apply-templates/>
+    <xsl:text> </xsl:text>
+  </xsl:template>
+</xsl:stylesheet>
+"""))
+
+# Leading bytes searched for a BOM or <meta charset> when no charset is declared
+_CHARSET_PRESCAN_SIZE = 4096
+
+# Transient HTTP statuses worth retrying
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# govinfo package prefixes in URL paths, checked in order
+_DOCUMENT_TYPES = (
+    ('/CDOC-', 'congressional_document'),
+    ('/BILLS-', 'bill'),
+    ('/CRPT-', 'congressional_report'),
+    ('/CREC-', 'congressional_record'),
+    ('/FR-', 'federal_register'),
+)
+
+
+def _declared_charset(headers) -> Optional[str]:
+    """Charset declared in a response's Content-Type header, or None"""
+    message = email.message.Message()
+    message["Content-Type"] = headers.get("Content-Type", "")
+    return message.get_content_charset()
+
+
+def _decode_html(body: bytes, headers) -> str:
+    """Decode an HTML body as the streaming parser reads it.
+    
+    A declared charset wins; otherwise libxml2 works it out from a BOM or
+    <meta charset> near the start. requests and aiohttp would instead fall
+    back to ISO-8859-1 or UTF-8 and ignore the document's declaration.
+    """
+    charset = _declared_charset(headers)
+    if charset is not None:
+        try:
+            return body.decode(charset, errors="replace")
+        except LookupError:
+            pass
+    
+    parser = lxml.html.HTMLParser()
+    parser.feed(body[:_CHARSET_PRESCAN_SIZE])
+    try:
+        tree = parser.close()
+    except etree.XMLSyntaxError:
+        tree = None
+    charset = tree.getroottree().docinfo.encoding if tree is not None else None
+    try:
+        return body.decode(charset or "iso-8859-1", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart"""
+    
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+    
+    def _reserve(self) -> float:
+        """Reserve the next slot and return the seconds until it comes up"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        return slot - now
+    
+    def wait(self):
+        """Block until the caller's reserved slot comes up"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+    
+    async def wait_async(self):
+        """Sleep on the event loop until the caller's reserved slot comes up"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
 
 
 class GovInfoParser:
@@ -22,69 +150,242 @@ class GovInfoParser:
         self.retry_attempts = self.config.get("govinfo", {}).get("retry_attempts", 3)
         self.retry_delay = self.config.get("govinfo", {}).get("retry_delay", 1)
         
-        # HTML to text converter
-        self.html_converter = html2text.HTML2Text()
-        self.html_converter.ignore_links = False
-        self.html_converter.ignore_images = True
+        self.timeout = self.config.get("document_processing", {}).get("timeout", 30)
+        
+        # Shared by all threads using this parser so the rate limit stays global
+        self.rate_limiter = RateLimiter(self.rate_limit)
+        
+        # Keep-alive connection pool; transient failures are retried by the adapter
+        self.session = self._create_session()
         
-    def parse_govinfo_document(self, url: str) -> List[Document]:
+        # Disk cache for fetched HTML and parsed chunks (None when disabled)
+        self.cache = DocumentCache.from_config(self.config)
+        
+    def parse_govinfo_document(self, url: str) -> List["Document"]:
         """Parse a government document from govinfo.gov URL"""
         logger.info(f"Parsing document from: {url}")
         
-        # Fetch the document content
-        content = self.fetch_document(url)
+        cache_key = self._parsed_cache_key(url)
+        if cache_key:
+            documents = self.cache.get(cache_key)
+            if documents is not None:
+                logger.info(f"Loaded {len(documents)} cached document chunks")
+                return documents
+        
+        # Fetch and parse the document once; the tree is shared by the extraction steps
+        documents = self._parse_from_content(self._fetch_tree(url), url)
+        
+        if cache_key:
+            self.cache.set(cache_key, documents)
+        
+        logger.info(f"Created {len(documents)} document chunks")
+        return documents
+    
+    def _parsed_cache_key(self, url: str) -> Optional[str]:
+        """Cache key for the parsed chunks of a URL, or None when caching is disabled"""
+        if not self.cache:
+            return None
+        
+        llama_config = self.config.get("llama_index", {})
+        return self.cache.make_key(
+            "parsed", url, llama_config.get("chunk_size", 1024), llama_config.get("chunk_overlap", 200)
+        )
+    
+    def _parse_from_content(self, content: Union[str, lxml.html.HtmlElement], url: str,
+                            metadata: Dict = None) -> List["Document"]:
+        """Build document chunks from already fetched HTML or a parsed tree"""
+        tree = self._parse_html(content)
         
         # Extract metadata
-        metadata = self.extract_metadata(content, url)
+        if metadata is None:
+            metadata = self.extract_metadata(tree, url)
         
         # Parse HTML content into text
-        text_content = self.parse_html_content(content)
-        
-        # Chunk the document
-        chunks = self.chunk_document(text_content)
-        
-        # Create Document objects
-        documents = []
-        for i, chunk in enumerate(chunks):
-            doc_metadata = metadata.copy()
-            doc_metadata.update({
-                "chunk_id": i,
-                "total_chunks": len(chunks),
-                "source_url": url
-            })
-            
-            documents.append(Document(
+        text_content = self.parse_html_content(tree)
+        
+        # Chunk the document and classify each chunk
+        chunks = self._chunk_and_classify(text_content)
+        
+        # llama_index is imported on first use; it dominates the package's import time
+        from llama_index import Document
+        
+        # Create Document objects with stable ids so re-loaded chunks are recognised;
+        # per-chunk fields are merged into one new dict per chunk while the shared
+        # metadata values are referenced, not copied
+        total_chunks = len(chunks)
+        return [
+            Document(
+                id_=f"{url}#{i}",
                 text=chunk,
-                metadata=doc_metadata
-            ))
+                metadata={
+                    **metadata,
+                    "chunk_id": i,
+                    "total_chunks": total_chunks,
+                    "source_url": url,
+                    "legal_category": category,
+                    "legal_entities": entities
+                }
+            )
+            for i, (chunk, category, entities) in enumerate(chunks)
+        ]
+    
+    def _create_session(self) -> requests.Session:
+        """Create an HTTP session with connection pooling and retries"""
+        retry = Retry(
+            total=max(self.retry_attempts - 1, 0),
+            backoff_factor=self.retry_delay,
+            status_forcelist=_RETRY_STATUSES,
+            raise_on_status=False
+        )
+        pool_size = self.config.get("document_processing", {}).get("max_workers", 8)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
         
-        logger.info(f"Created {len(documents)} document chunks")
-        return documents
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        
+        # Sent on every request; connections to govinfo.gov are kept alive across fetches
+        session.headers.update({
+            "User-Agent": self.config.get("govinfo", {}).get("user_agent", f"legal-ai/{__version__}"),
+            "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+        })
+        return session
     
     def fetch_document(self, url: str) -> str:
         """Fetch document content from URL with retries"""
-        for attempt in range(self.retry_attempts):
+        if self.cache:
+            content = self.cache.get_html(url)
+            if content is not None:
+                logger.info(f"Loaded cached document for {url}")
+                return content
+        
+        # Rate limiting
+        self.rate_limiter.wait()
+        
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.error(f"Failed to fetch document after {self.retry_attempts} attempts: {e}")
+            raise
+        
+        logger.info(f"Successfully fetched document from {url}")
+        content = _decode_html(response.content, response.headers)
+        if self.cache:
+            self.cache.set_html(url, content)
+        return content
+    
+    async def afetch_many(self, urls: List[str]) -> List[str]:
+        """Fetch documents concurrently on one event loop, returning them in URL order"""
+        import aiohttp
+        
+        pool_size = self.config.get("document_processing", {}).get("max_workers", 8)
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={key: self.session.headers[key] for key in ("User-Agent", "Accept")}
+        ) as session:
+            return await asyncio.gather(*(self._afetch(session, url) for url in urls))
+    
+    async def _afetch(self, session: "aiohttp.ClientSession", url: str) -> str:
+        """Fetch one document with the same cache, rate limit and retry policy as fetch_document"""
+        import aiohttp
+        
+        if self.cache:
+            content = self.cache.get_html(url)
+            if content is not None:
+                logger.info(f"Loaded cached document for {url}")
+                return content
+        
+        attempts = max(self.retry_attempts, 1)
+        for attempt in range(attempts):
+            await self.rate_limiter.wait_async()
+            try:
+                async with session.get(url) as response:
+                    if response.status not in _RETRY_STATUSES or attempt == attempts - 1:
+                        response.raise_for_status()
+                        content = _decode_html(await response.read(), response.headers)
+                        break
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Failed to fetch document from {url}: {e}")
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == attempts - 1:
+                    logger.error(f"Failed to fetch document from {url}: {e}")
+                    raise
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        
+        logger.info(f"Successfully fetched document from {url}")
+        if self.cache:
+            self.cache.set_html(url, content)
+        return content
+    
+    def _fetch_tree(self, url: str) -> lxml.html.HtmlElement:
+        """Fetch a document and parse it while it downloads.
+        
+        The body is streamed into lxml's feed parser, so the full HTML is never
+        held as a decoded string next to the tree.
+        """
+        if self.cache:
+            content = self.cache.get_html(url)
+            if content is not None:
+                logger.info(f"Loaded cached document for {url}")
+                return self._parse_html(content)
+        
+        # Rate limiting
+        self.rate_limiter.wait()
+        
+        try:
+            response = self.session.get(url, timeout=self.timeout, stream=True)
             try:
-                # Rate limiting
-                time.sleep(1 / self.rate_limit)
-                
-                response = requests.get(url, timeout=30)
                 response.raise_for_status()
                 
-                logger.info(f"Successfully fetched document from {url}")
-                return response.text
-                
-            except requests.RequestException as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {e}")
-                if attempt < self.retry_attempts - 1:
-                    time.sleep(self.retry_delay * (attempt + 1))
-                else:
-                    logger.error(f"Failed to fetch document after {self.retry_attempts} attempts")
-                    raise
+                # requests assumes ISO-8859-1 for text/* without a charset, which would
+                # override <meta charset>; only a declared charset is passed on
+                try:
+                    parser = lxml.html.HTMLParser(encoding=_declared_charset(response.headers), huge_tree=True)
+                except LookupError:
+                    # An unknown charset such as "none"; libxml2 detects it instead
+                    parser = lxml.html.HTMLParser(huge_tree=True)
+                for chunk in response.iter_content(chunk_size=_STREAM_CHUNK_SIZE):
+                    parser.feed(chunk)
+            finally:
+                response.close()
+        except requests.RequestException as e:
+            logger.error(f"Failed to fetch document after {self.retry_attempts} attempts: {e}")
+            raise
+        
+        logger.info(f"Successfully fetched document from {url}")
+        try:
+            tree = parser.close()
+        except etree.XMLSyntaxError:
+            tree = None
+        if tree is None:
+            return lxml.html.document_fromstring(_EMPTY_HTML, parser=_HTML_PARSER)
+        return tree
+    
+    def _parse_html(self, html_content: Union[str, lxml.html.HtmlElement]) -> lxml.html.HtmlElement:
+        """Parse HTML into an lxml tree, passing already parsed trees through"""
+        if not isinstance(html_content, str):
+            return html_content
+        
+        try:
+            return lxml.html.document_fromstring(html_content.encode("utf-8"), parser=_HTML_PARSER)
+        except etree.ParserError:
+            # Empty or whitespace-only documents
+            return lxml.html.document_fromstring(_EMPTY_HTML, parser=_HTML_PARSER)
+    
+    def _find_div(self, tree: lxml.html.HtmlElement, class_name: str) -> Optional[lxml.html.HtmlElement]:
+        """Find the first div carrying the given CSS class"""
+        # Cheaper than find_class, which runs an XPath test on every element
+        for elem in tree.iter('div'):
+            if class_name in (elem.get('class') or '').split():
+                return elem
+        return None
     
-    def extract_metadata(self, html_content: str, url: str) -> Dict:
-        """Extract metadata from HTML content"""
-        soup = BeautifulSoup(html_content, 'html.parser')
+    def extract_metadata(self, html_content: Union[str, lxml.html.HtmlElement], url: str) -> Dict:
+        """Extract metadata from HTML content or an already parsed tree"""
+        tree = self._parse_html(html_content)
         
         metadata = {
             "source_url": url,
@@ -92,68 +393,58 @@ class GovInfoParser:
         }
         
         # Extract title
-        title_tag = soup.find('title')
-        if title_tag:
-            metadata["title"] = title_tag.get_text().strip()
+        title = tree.findtext('.//title')
+        if title is not None:
+            metadata["title"] = title.strip()
         
         # Extract meta tags
-        for meta in soup.find_all('meta'):
+        for meta in tree.iter('meta'):
             name = meta.get('name') or meta.get('property')
             content = meta.get('content')
             if name and content:
                 metadata[name] = content
         
         # Extract document-specific information
-        self._extract_document_info(soup, metadata)
+        self._extract_document_info(tree, metadata)
         
         return metadata
     
     def _extract_document_type(self, url: str) -> str:
         """Extract document type from URL"""
         path = urlparse(url).path
-        if '/CDOC-' in path:
-            return 'congressional_document'
-        elif '/BILLS-' in path:
-            return 'bill'
-        elif '/CRPT-' in path:
-            return 'congressional_report'
-        elif '/CREC-' in path:
-            return 'congressional_record'
-        elif '/FR-' in path:
-            return 'federal_register'
-        else:
-            return 'unknown'
-    
-    def _extract_document_info(self, soup: BeautifulSoup, metadata: Dict):
+        for marker, document_type in _DOCUMENT_TYPES:
+            if marker in path:
+                return document_type
+        return 'unknown'
+    
+    def _extract_document_info(self, tree: lxml.html.HtmlElement, metadata: Dict):
         """Extract additional document information"""
         # Look for document header information
-        header = soup.find('div', class_='document-header')
-        if header:
-            metadata["header_info"] = header.get_text().strip()
+        header = self._find_div(tree, 'document-header')
+        if header is not None:
+            metadata["header_info"] = header.text_content().strip()
         
-        # Extract date information
-        date_elements = soup.find_all(['span', 'div'], class_=lambda x: x and 'date' in x.lower())
-        for elem in date_elements:
-            metadata.setdefault("dates", []).append(elem.get_text().strip())
+        # Extract date information from span/div elements whose class mentions "date"
+        dates = [
+            elem.text_content().strip()
+            for elem in tree.iter('span', 'div')
+            if 'date' in (elem.get('class') or '').lower()
+        ]
+        if dates:
+            metadata["dates"] = dates
     
-    def parse_html_content(self, html_content: str) -> str:
-        """Convert HTML content to plain text"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
+    def parse_html_content(self, html_content: Union[str, lxml.html.HtmlElement]) -> str:
+        """Convert HTML content (or an already parsed tree) to plain text"""
+        tree = self._parse_html(html_content)
         
         # Extract main content
-        main_content = soup.find('div', class_='document-content')
-        if not main_content:
-            main_content = soup.find('body')
+        main_content = self._find_div(tree, 'document-content')
+        if main_content is None:
+            main_content = tree.find('body')
+        if main_content is None:
+            main_content = tree
         
-        if main_content:
-            # Convert to text using html2text for better formatting
-            text = self.html_converter.handle(str(main_content))
-        else:
-            text = self.html_converter.handle(html_content)
+        text = str(_TEXT_XSLT(main_content))
         
         # Clean up the text
         text = self._clean_text(text)
@@ -162,15 +453,9 @@ class GovInfoParser:
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text content"""
-        # Remove excessive whitespace
-        lines = [line.strip() for line in text.split('\n')]
-        cleaned_lines = []
-        
-        for line in lines:
-            if line:  # Skip empty lines
-                cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
+        # Strip every line and drop the empty ones without building
+        # intermediate lists of stripped and kept lines
+        return '\n'.join(filter(None, map(str.strip, text.split('\n'))))
     
     def chunk_document(self, text: str) -> List[str]:
         """Split document into chunks for processing"""
@@ -184,13 +469,12 @@ class GovInfoParser:
         while start < len(text):
             end = start + chunk_size
             
-            # Try to break at sentence boundary
+            # Try to break at the last sentence boundary in the lookback window
             if end < len(text):
-                # Look for sentence ending
-                for i in range(end, max(start + chunk_size - 200, start), -1):
-                    if text[i] in '.!?':
-                        end = i + 1
-                        break
+                lookback = max(start + chunk_size - 200, start) + 1
+                boundary = max(text.rfind(mark, lookback, end + 1) for mark in '.!?')
+                if boundary >= 0:
+                    end = boundary + 1
             
             chunk = text[start:end].strip()
             if chunk:
@@ -201,6 +485,10 @@ class GovInfoParser:
                 break
         
         return chunks
+    
+    def _chunk_and_classify(self, text: str) -> List[Tuple[str, str, List[str]]]:
+        """Chunk text into (chunk, legal category, legal entities) tuples"""
+        return [(chunk, *analyze_legal_text(chunk)) for chunk in self.chunk_document(text)]
 
 
 class DocumentParser(GovInfoParser):
@@ -212,20 +500,28 @@ class BatchProcessor:
     """Process multiple documents in batch"""
     
     def __init__(self, config: Dict = None):
+        self.config = config or {}
         self.parser = GovInfoParser(config)
+        self.max_workers = self.config.get("document_processing", {}).get("max_workers", 8)
     
-    def process_urls(self, urls: List[str]) -> List[Document]:
-        """Process multiple URLs and return all documents"""
-        all_documents = []
+    def process_urls(self, urls: List[str]) -> List["Document"]:
+        """Process multiple URLs concurrently and return all documents in URL order"""
+        results = {}
         
-        for i, url in enumerate(urls):
-            logger.info(f"Processing document {i+1}/{len(urls)}: {url}")
-            try:
-                documents = self.parser.parse_govinfo_document(url)
-                all_documents.extend(documents)
-            except Exception as e:
-                logger.error(f"Failed to process {url}: {e}")
-                continue
+        if urls:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+                futures = {executor.submit(self.parser.parse_govinfo_document, url): url for url in urls}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        results[url] = future.result()
+                        logger.info(f"Processed {url}")
+                    except Exception as e:
+                        logger.error(f"Failed to process {url}: {e}")
+        
+        all_documents = []
+        for url in urls:
+            all_documents.extend(results.get(url, []))
         
         logger.info(f"Processed {len(urls)} URLs, created {len(all_documents)} document chunks")
         return all_documents
@@ -236,9 +532,15 @@ class EnhancedGovInfoParser(GovInfoParser):
     
     def parse_with_metadata(self, url: str) -> Dict:
         """Parse document and return both content and detailed metadata"""
+        # One fetch and one parse serve the metadata, the chunks and the raw content
         content = self.fetch_document(url)
-        metadata = self.extract_metadata(content, url)
-        documents = self.parse_govinfo_document(url)
+        tree = self._parse_html(content)
+        metadata = self.extract_metadata(tree, url)
+        documents = self._parse_from_content(tree, url, metadata)
+        
+        cache_key = self._parsed_cache_key(url)
+        if cache_key:
+            self.cache.set(cache_key, documents)
         
         return {
             "documents": documents,
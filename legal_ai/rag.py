@@ -2,27 +2,216 @@
 RAG (Retrieval-Augmented Generation) system for legal documents
 """
 
+import asyncio
+import glob
 import os
-from typing import List, Dict, Optional
+import shutil
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Dict, Optional, Tuple, Union
+import numpy as np
 from loguru import logger
 
-from llama_index import VectorStoreIndex, ServiceContext, StorageContext
+from llama_index import VectorStoreIndex, ServiceContext, StorageContext, load_index_from_storage
 from llama_index.llms import OpenAI
+from llama_index.bridge.pydantic import PrivateAttr
 from llama_index.embeddings import OpenAIEmbedding
+from llama_index.embeddings.base import BaseEmbedding
 from llama_index import Document
-from llama_index.retrievers import VectorIndexRetriever
+from llama_index.core.base_retriever import BaseRetriever
+from llama_index.retrievers import BM25Retriever, VectorIndexRetriever
 from llama_index.query_engine import RetrieverQueryEngine
 from llama_index.response_synthesizers import ResponseMode
+from llama_index.ingestion import run_transformations
+from llama_index.schema import NodeWithScore, QueryBundle
+from llama_index.vector_stores import FaissVectorStore
+
+from .analysis import analyze_legal_text, classify_legal_content, extract_legal_entities
+from .cache import DocumentCache, SemanticCache, content_signature
+
+
+# Indexes whose query engines are kept; older ones are evicted first
+_MAX_INDEX_STATES = 8
+
+# Vectors sampled before an int8 (HNSWSQ) index learns its value ranges
+_MIN_SQ_TRAINING_SIZE = 256
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a process may still be running (always assumed on Windows)"""
+    if pid == os.getpid() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _min_training_size(faiss_index) -> int:
+    """Smallest batch an untrained faiss index can be trained on"""
+    # Scalar quantizers fix each dimension's range from the training sample,
+    # so a handful of vectors would clip everything added after them
+    size = max(getattr(faiss_index, "nlist", 1), _MIN_SQ_TRAINING_SIZE)
+    pq = getattr(faiss_index, "pq", None)
+    if pq is not None:
+        size = max(size, pq.ksub)
+    return size
+
+
+class _BatchFaissVectorStore(FaissVectorStore):
+    """Faiss store that adds each batch in one call, training the index first if needed"""
+    
+    def add(self, nodes, **add_kwargs) -> List[str]:
+        if not nodes:
+            return []
+        
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        if not self._faiss_index.is_trained:
+            if len(embeddings) < _min_training_size(self._faiss_index):
+                # k-means needs at least one vector per centroid and quantizer
+                # ranges a representative sample; a corpus this small is
+                # searched faster exactly, until retrain() has enough
+                import faiss
+                logger.warning(f"Only {len(embeddings)} vectors to train the faiss index, using exact search")
+                self._faiss_index = faiss.IndexFlat(self._faiss_index.d, self._faiss_index.metric_type)
+            else:
+                self._faiss_index.train(embeddings)
+        
+        start = self._faiss_index.ntotal
+        self._faiss_index.add(embeddings)
+        return [str(i) for i in range(start, start + len(nodes))]
+    
+    def retrain(self, faiss_index) -> bool:
+        """Move every vector into an untrained index once there are enough to train it"""
+        if self._faiss_index.ntotal < _min_training_size(faiss_index):
+            return False
+        
+        # Positions, and so node ids, are kept since vectors are re-added in order
+        embeddings = self._faiss_index.reconstruct_n(0, self._faiss_index.ntotal)
+        faiss_index.train(embeddings)
+        faiss_index.add(embeddings)
+        self._faiss_index = faiss_index
+        return True
+
+
+class _HybridRetriever(BaseRetriever):
+    """Fuse vector and keyword retrieval rankings by reciprocal rank"""
+    
+    # Damps the lead of top ranks, as in the original reciprocal rank fusion paper
+    _RRF_K = 60
+    
+    def __init__(self, vector_retriever: BaseRetriever, keyword_retriever: BaseRetriever,
+                 similarity_top_k: int):
+        self._vector_retriever = vector_retriever
+        self._keyword_retriever = keyword_retriever
+        self._similarity_top_k = similarity_top_k
+        super().__init__()
+    
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # The vector side gets the whole bundle so a precomputed query embedding is reused
+        rankings = (
+            self._vector_retriever.retrieve(query_bundle),
+            self._keyword_retriever.retrieve(query_bundle.query_str)
+        )
+        results = {}
+        scores = {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking):
+                node_id = result.node.node_id
+                results.setdefault(node_id, result)
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self._RRF_K + rank)
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self._similarity_top_k]
+        return [NodeWithScore(node=results[node_id].node, score=scores[node_id]) for node_id in ranked]
+
+
+class _CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that reuses vectors of previously embedded texts"""
+    
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: DocumentCache = PrivateAttr()
+    
+    def __init__(self, embed_model: BaseEmbedding, cache: DocumentCache):
+        super().__init__(model_name=embed_model.model_name, embed_batch_size=embed_model.embed_batch_size)
+        self._embed_model = embed_model
+        self._cache = cache
+    
+    def _lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], Dict[str, str]]:
+        """Return content-addressed keys, cached vectors, and the uncached texts by key"""
+        keys = [self._cache.make_key("embedding", self.model_name, text) for text in texts]
+        vectors, missing = {}, {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self._cache.cache.get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+        return keys, vectors, missing
+    
+    def _store(self, keys: List[str], vectors: Dict[str, np.ndarray], missing: Dict[str, str],
+               embeddings: List[List[float]]) -> List[List[float]]:
+        """Cache fresh embeddings without expiry and return vectors in text order"""
+        for key, embedding in zip(missing, embeddings):
+            vectors[key] = np.asarray(embedding, dtype=np.float32)
+            self._cache.cache.set(key, vectors[key])
+        return [vectors[key].tolist() for key in keys]
+    
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        embeddings = self._embed_model.get_text_embedding_batch(list(missing.values())) if missing else []
+        return self._store(keys, vectors, missing, embeddings)
+    
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        embeddings = await self._embed_model.aget_text_embedding_batch(list(missing.values())) if missing else []
+        return self._store(keys, vectors, missing, embeddings)
+    
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+    
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+    
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model.get_query_embedding(query)
+    
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model.aget_query_embedding(query)
 
 
 class RAGSystem:
     """Basic RAG system implementation"""
     
-    def __init__(self, config: Dict = None):
+    def __init__(self, config: Dict = None, cache: Optional[DocumentCache] = None):
         self.config = config or {}
+        
+        # Disk cache for answers and embeddings; near-duplicate questions are matched by the semantic cache
+        self.response_cache = cache if cache is not None else DocumentCache.from_config(self.config)
         self.service_context = self._create_service_context()
+        self.semantic_cache = self._create_semantic_cache()
         self.index = None
         self.query_engine = None
+        
+        # Per-index memo for indexes passed to query(), most recently used last.
+        # Engines reference their index, so a weak-keyed map would never release it.
+        self._index_states: "OrderedDict[str, Dict]" = OrderedDict()
+    
+    def _create_semantic_cache(self) -> Optional[SemanticCache]:
+        """Create the near-duplicate query cache if enabled"""
+        rag_config = self.config.get("rag", {})
+        if not rag_config.get("semantic_cache", False):
+            return None
+        
+        return SemanticCache(
+            threshold=rag_config.get("semantic_cache_threshold", 0.95),
+            ttl=self.config.get("cache", {}).get("ttl", 3600),
+            store=self.response_cache if rag_config.get("semantic_cache_persist", False) else None
+        )
     
     def _create_service_context(self) -> ServiceContext:
         """Create LlamaIndex service context"""
@@ -33,8 +222,15 @@ class RAGSystem:
             max_tokens=self.config.get("rag", {}).get("max_tokens", 512)
         )
         
-        # Configure embedding model
-        embed_model = OpenAIEmbedding()
+        # Configure embedding model; chunks are sent to the embeddings
+        # endpoint in batches rather than one request per chunk
+        embed_model = OpenAIEmbedding(
+            embed_batch_size=self.config.get("llama_index", {}).get("embed_batch_size", 100)
+        )
+        
+        # Identical chunks, e.g. boilerplate shared across documents, are embedded once
+        if self.response_cache is not None and self.config.get("cache", {}).get("embeddings", False):
+            embed_model = _CachedEmbedding(embed_model, self.response_cache)
         
         return ServiceContext.from_defaults(
             llm=llm,
@@ -47,35 +243,341 @@ class RAGSystem:
         """Build vector index from documents"""
         logger.info(f"Building index from {len(documents)} documents")
         
+        # With use_async the embedding batches are requested concurrently
         self.index = VectorStoreIndex.from_documents(
             documents,
-            service_context=self.service_context
+            service_context=self.service_context,
+            storage_context=self._create_storage_context(),
+            use_async=self._use_async()
         )
         
+        self._train_deferred_faiss_index()
+        
         # Create query engine
-        self.query_engine = self.index.as_query_engine(
-            similarity_top_k=self.config.get("llama_index", {}).get("similarity_top_k", 5),
-            response_mode=ResponseMode.COMPACT
-        )
+        self._create_default_query_engine()
         
         logger.info("Index built successfully")
         return self.index
     
-    def query(self, question: str, index: VectorStoreIndex = None) -> str:
-        """Query the RAG system"""
-        if index:
-            query_engine = index.as_query_engine(
-                similarity_top_k=self.config.get("llama_index", {}).get("similarity_top_k", 5)
+    def _use_async(self) -> bool:
+        """Whether index building may embed batches concurrently"""
+        if not self.config.get("llama_index", {}).get("use_async", False):
+            return False
+        
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return True
+        
+        # llama_index drives the batches with asyncio.run, which fails inside a running loop
+        logger.debug("Called from a running event loop, embedding batches sequentially")
+        return False
+    
+    def insert_documents(self, documents: List[Document]) -> int:
+        """Bring the current index up to date with documents and return how many changed
+        
+        Chunks of a ``source_url`` that the documents no longer include are removed,
+        so a re-parsed document that got shorter leaves no stale chunks behind.
+        """
+        if self.index is None:
+            raise ValueError("No index available. Build index first.")
+        
+        docstore = self.index.docstore
+        namespace = self._cache_namespace(self.index)
+        doc_ids = {doc.get_doc_id() for doc in documents}
+        sources = {doc.metadata["source_url"] for doc in documents if "source_url" in doc.metadata}
+        removed = [
+            doc_id for doc_id in list(self.index.ref_doc_info)
+            if doc_id not in doc_ids and doc_id.rpartition("#")[0] in sources
+            and self._delete_document(doc_id)
+        ]
+        
+        pending = []
+        for doc in documents:
+            stored_hash = docstore.get_document_hash(doc.get_doc_id())
+            if stored_hash == doc.hash:
+                continue
+            if stored_hash is not None and not self._delete_document(doc.get_doc_id()):
+                continue
+            pending.append(doc)
+        
+        if pending:
+            # Split all documents first so their chunks are embedded in shared batches
+            nodes = run_transformations(pending, self.service_context.transformations)
+            self.index.insert_nodes(nodes)
+            for doc in pending:
+                docstore.set_document_hash(doc.get_doc_id(), doc.hash)
+            self._train_deferred_faiss_index()
+        
+        if pending or removed:
+            # Query engines hold a keyword index of the old nodes, and cached
+            # answers were drawn from them; the namespace changes with the documents
+            self._index_states.pop(self.index.index_id, None)
+            self._create_default_query_engine()
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear(namespace)
+        
+        logger.info(f"Inserted {len(pending)} of {len(documents)} documents and removed {len(removed)} from the index")
+        return len(pending) + len(removed)
+    
+    def _delete_document(self, doc_id: str) -> bool:
+        """Remove a document's nodes from the index; False if the vector store cannot delete"""
+        try:
+            self.index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        except NotImplementedError:
+            logger.warning(f"Vector store cannot delete; rebuild the index to update {doc_id}")
+            return False
+        return True
+    
+    def persist_index(self, persist_dir: str, overwrite: bool = False) -> None:
+        """Persist the current index so later runs can skip embedding"""
+        if self.index is None:
+            raise ValueError("No index available. Build index first.")
+        
+        # Write to a scratch directory first so a partial write is never loaded
+        staging_dir = f"{persist_dir}.tmp-{os.getpid()}"
+        self.index.storage_context.persist(persist_dir=staging_dir)
+        if overwrite and os.path.isdir(persist_dir):
+            retired_dir = f"{persist_dir}.old-{os.getpid()}"
+            os.replace(persist_dir, retired_dir)
+            os.replace(staging_dir, persist_dir)
+            shutil.rmtree(retired_dir, ignore_errors=True)
+        else:
+            try:
+                os.replace(staging_dir, persist_dir)
+            except OSError:
+                # Another process persisted the same index first
+                shutil.rmtree(staging_dir, ignore_errors=True)
+        logger.info(f"Index persisted to {persist_dir}")
+    
+    def recover_persisted_index(self, persist_dir: str) -> None:
+        """Finish or undo a persist_index that was interrupted, e.g. by a crash"""
+        for retired_dir in glob.glob(f"{glob.escape(persist_dir)}.old-*"):
+            pid = retired_dir.rpartition("-")[2]
+            if not pid.isdigit() or _process_alive(int(pid)):
+                continue
+            
+            # A retired directory only exists once staging finished, so the staged
+            # copy is complete and newer; fall back to the retired one without it
+            staging_dir = f"{persist_dir}.tmp-{pid}"
+            if not os.path.isdir(persist_dir):
+                restored_dir = staging_dir if os.path.isdir(staging_dir) else retired_dir
+                os.replace(restored_dir, persist_dir)
+                logger.warning(f"Recovered index in {persist_dir} from {restored_dir}")
+            shutil.rmtree(retired_dir, ignore_errors=True)
+        
+        for staging_dir in glob.glob(f"{glob.escape(persist_dir)}.tmp-*"):
+            pid = staging_dir.rpartition("-")[2]
+            if pid.isdigit() and not _process_alive(int(pid)):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+    
+    def load_index(self, persist_dir: str) -> VectorStoreIndex:
+        """Load an index previously saved with persist_index"""
+        storage_context = self._create_storage_context(persist_dir)
+        self.index = load_index_from_storage(storage_context, service_context=self.service_context)
+        self._train_deferred_faiss_index()
+        self._create_default_query_engine()
+        
+        logger.info(f"Index loaded from {persist_dir}")
+        return self.index
+    
+    def _create_storage_context(self, persist_dir: str = None) -> Optional[StorageContext]:
+        """Create the storage context for the configured vector store"""
+        llama_config = self.config.get("llama_index", {})
+        if llama_config.get("vector_store", "simple") != "faiss":
+            return StorageContext.from_defaults(persist_dir=persist_dir) if persist_dir else None
+        
+        try:
+            import faiss
+        except ImportError as e:
+            raise ImportError("The faiss vector store requires faiss: pip install legal-ai[faiss]") from e
+        
+        if persist_dir:
+            vector_store = _BatchFaissVectorStore.from_persist_dir(persist_dir)
+        else:
+            vector_store = _BatchFaissVectorStore(faiss_index=self._create_faiss_index(faiss))
+        
+        return StorageContext.from_defaults(vector_store=vector_store, persist_dir=persist_dir)
+    
+    def _create_faiss_index(self, faiss):
+        """Create an empty faiss index as configured"""
+        # HNSW graph search is logarithmic in the number of chunks, unlike the
+        # brute-force scan of the default store. Past ~100k chunks "pq" (IndexIVFPQ)
+        # trades a training pass for much smaller product-quantized vectors.
+        # OpenAI embeddings are unit length, so inner product ranks like cosine.
+        llama_config = self.config.get("llama_index", {})
+        dim = llama_config.get("embed_dim", 1536)
+        quantize = llama_config.get("quantize", False)
+        if quantize == "pq":
+            # Each vector becomes pq_m one-byte codes searched in nprobe of nlist cells
+            quantizer = faiss.IndexFlatIP(dim)
+            faiss_index = faiss.IndexIVFPQ(
+                quantizer, dim, llama_config.get("ivf_nlist", 256),
+                llama_config.get("pq_m", 16), 8, faiss.METRIC_INNER_PRODUCT
+            )
+            faiss_index.nprobe = llama_config.get("ivf_nprobe", 16)
+            return faiss_index
+        
+        m = llama_config.get("hnsw_m", 32)
+        if quantize:
+            # int8 scalar quantization stores a quarter of the float32 bytes
+            faiss_index = faiss.IndexHNSWSQ(
+                dim, faiss.ScalarQuantizer.QT_8bit, m, faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            faiss_index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+        faiss_index.hnsw.efConstruction = llama_config.get("hnsw_ef_construction", 200)
+        faiss_index.hnsw.efSearch = llama_config.get("hnsw_ef_search", 64)
+        return faiss_index
+    
+    def _train_deferred_faiss_index(self) -> None:
+        """Move a quantized store off its exact fallback once it holds enough vectors to train"""
+        llama_config = self.config.get("llama_index", {})
+        if llama_config.get("vector_store") != "faiss" or not llama_config.get("quantize"):
+            return
+        
+        import faiss
+        vector_store = self.index.vector_store
+        if isinstance(vector_store, _BatchFaissVectorStore) and isinstance(vector_store.client, faiss.IndexFlat):
+            if vector_store.retrain(self._create_faiss_index(faiss)):
+                logger.info(f"Trained the quantized faiss index on {vector_store.client.ntotal} vectors")
+    
+    def _create_default_query_engine(self):
+        """Create the query engine used when query() is called without an index"""
+        self.query_engine = self._build_query_engine(self.index)
+    
+    def _build_query_engine(self, index: VectorStoreIndex, streaming: bool = False):
+        """Create a query engine over an index, with keyword retrieval if configured"""
+        similarity_top_k = self.config.get("llama_index", {}).get("similarity_top_k", 5)
+        if not self.config.get("rag", {}).get("hybrid_search", False):
+            return index.as_query_engine(
+                similarity_top_k=similarity_top_k,
+                response_mode=ResponseMode.COMPACT,
+                streaming=streaming
             )
+        
+        # BM25 catches exact citations like "Section 101" that embeddings rank loosely
+        retriever = _HybridRetriever(
+            index.as_retriever(similarity_top_k=similarity_top_k),
+            BM25Retriever.from_defaults(docstore=index.docstore, similarity_top_k=similarity_top_k),
+            similarity_top_k
+        )
+        return RetrieverQueryEngine.from_args(
+            retriever,
+            service_context=index.service_context,
+            response_mode=ResponseMode.COMPACT,
+            streaming=streaming
+        )
+    
+    def query(self, question: str, index: VectorStoreIndex = None, no_cache: bool = False,
+              stream: bool = False) -> Union[str, Iterator[str]]:
+        """Query the RAG system, answering repeated and near-duplicate questions from cache
+        
+        With stream=True the answer is returned as a generator of tokens.
+        """
+        if stream:
+            if not (index or self.index):
+                raise ValueError("No index available. Build index first.")
+            query_engine = self._get_query_engine(index or self.index, streaming=True)
+        elif index:
+            query_engine = self._get_query_engine(index)
         elif self.query_engine:
             query_engine = self.query_engine
         else:
             raise ValueError("No index available. Build index first.")
         
         logger.info(f"Processing query: {question}")
-        response = query_engine.query(question)
+        if no_cache or (self.response_cache is None and self.semantic_cache is None):
+            response = query_engine.query(question)
+            return response.response_gen if stream else str(response)
+        
+        namespace = self._cache_namespace(index or self.index)
+        cached, embedding = self._lookup_cached_answer(question, namespace)
+        if cached is not None:
+            return iter([cached]) if stream else cached
+        
+        # The embedding is reused for retrieval, so a semantic cache miss costs no extra API call
+        if embedding is not None:
+            response = query_engine.query(QueryBundle(query_str=question, embedding=embedding))
+        else:
+            response = query_engine.query(question)
+        if stream:
+            return self._stream_and_cache(response.response_gen, question, namespace, embedding)
+        
+        response = str(response)
+        self._cache_answer(question, namespace, embedding, response)
+        return response
+    
+    def _response_cache_key(self, question: str, namespace: str) -> str:
+        """Key an answer by question, index and every setting that shapes it"""
+        llm = self.service_context.llm
+        return self.response_cache.make_key(
+            "answer", namespace, question, llm.model, llm.temperature, llm.max_tokens,
+            self.config.get("llama_index", {}).get("similarity_top_k", 5),
+            self.config.get("rag", {}).get("hybrid_search", False)
+        )
+    
+    def _lookup_cached_answer(self, question: str, namespace: str) -> Tuple[Optional[str], Optional[List[float]]]:
+        """Return a cached answer and the query embedding computed for the semantic lookup"""
+        if self.response_cache is not None:
+            cached = self.response_cache.get(self._response_cache_key(question, namespace))
+            if cached is not None:
+                logger.info("Answered from response cache")
+                return cached, None
         
-        return str(response)
+        if self.semantic_cache is None:
+            return None, None
+        
+        embedding = self.service_context.embed_model.get_query_embedding(question)
+        cached = self.semantic_cache.lookup(embedding, namespace)
+        if cached is not None:
+            logger.info("Answered from semantic cache")
+        return cached, embedding
+    
+    def _cache_answer(self, question: str, namespace: str, embedding: Optional[List[float]], answer: str) -> None:
+        """Store an answer in the enabled caches"""
+        if self.response_cache is not None:
+            self.response_cache.set(self._response_cache_key(question, namespace), answer)
+        if embedding is not None:
+            self.semantic_cache.add(embedding, answer, namespace)
+    
+    def _stream_and_cache(self, tokens: Iterator[str], question: str, namespace: str,
+                          embedding: Optional[List[float]]) -> Iterator[str]:
+        """Yield streamed tokens, caching the full answer once the stream completes"""
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield token
+        self._cache_answer(question, namespace, embedding, "".join(parts))
+    
+    def _get_query_engine(self, index: VectorStoreIndex, streaming: bool = False):
+        """Return the query engine for an index, creating it on first use"""
+        query_engines = self._index_state(index)["engines"]
+        query_engine = query_engines.get(streaming)
+        if query_engine is None:
+            query_engine = self._build_query_engine(index, streaming=streaming)
+            query_engines[streaming] = query_engine
+        return query_engine
+    
+    def _index_state(self, index: VectorStoreIndex) -> Dict:
+        """Return the memo for an index, evicting the least recently used beyond the limit"""
+        state = self._index_states.get(index.index_id)
+        if state is None or state["index"] is not index:
+            # A reloaded index keeps its id but needs engines of its own
+            state = self._index_states[index.index_id] = {"index": index, "engines": {}}
+        self._index_states.move_to_end(index.index_id)
+        
+        while len(self._index_states) > _MAX_INDEX_STATES:
+            self._index_states.popitem(last=False)
+        return state
+    
+    def _cache_namespace(self, index: VectorStoreIndex) -> str:
+        """Namespace of an index's cached answers; changes whenever its documents change"""
+        state = self._index_state(index)
+        if "namespace" not in state:
+            document_hashes = index.docstore.get_all_document_hashes()
+            state["namespace"] = f"{index.index_id}:{content_signature(sorted(document_hashes))[:16]}"
+        return state["namespace"]
     
     def get_sources(self, response_text: str) -> List[str]:
         """Extract source information from response"""
@@ -87,8 +589,8 @@ class RAGSystem:
 class LegalRAG(RAGSystem):
     """Specialized RAG system for legal documents"""
     
-    def __init__(self, config: Dict = None):
-        super().__init__(config)
+    def __init__(self, config: Dict = None, cache: Optional[DocumentCache] = None):
+        super().__init__(config, cache)
         self.legal_prompt_template = self._create_legal_prompt_template()
     
     def _create_legal_prompt_template(self) -> str:
@@ -117,51 +619,52 @@ class LegalRAG(RAGSystem):
         
         return super().build_index(enhanced_documents)
     
+    def insert_documents(self, documents: List[Document]) -> int:
+        """Insert documents with legal document enhancements"""
+        return super().insert_documents(self._enhance_legal_documents(documents))
+    
     def _enhance_legal_documents(self, documents: List[Document]) -> List[Document]:
         """Add legal-specific enhancements to documents"""
-        enhanced = []
+        # Chunks from GovInfoParser are classified while parsing
+        pending = [
+            doc for doc in documents
+            if "legal_category" not in doc.metadata or "legal_entities" not in doc.metadata
+        ]
         
-        for doc in documents:
+        # Worker start-up and pickling only pay off on large batches. Workers run the
+        # module-level analysis, so subclasses overriding it stay in this process.
+        threshold = self.config.get("document_processing", {}).get("parallel_threshold", 5000)
+        overridden = (
+            type(self)._classify_legal_content is not LegalRAG._classify_legal_content
+            or type(self)._extract_legal_entities is not LegalRAG._extract_legal_entities
+        )
+        if len(pending) >= threshold and (os.cpu_count() or 1) > 1 and not overridden:
+            with ProcessPoolExecutor() as executor:
+                results = list(executor.map(
+                    analyze_legal_text, [doc.text for doc in pending], chunksize=64
+                ))
+        else:
+            results = [
+                (self._classify_legal_content(doc.text), self._extract_legal_entities(doc.text))
+                for doc in pending
+            ]
+        
+        for doc, (category, entities) in zip(pending, results):
             # Add legal document type classification
-            doc.metadata["legal_category"] = self._classify_legal_content(doc.text)
+            doc.metadata["legal_category"] = category
             
             # Extract legal entities (simplified)
-            doc.metadata["legal_entities"] = self._extract_legal_entities(doc.text)
-            
-            enhanced.append(doc)
+            doc.metadata["legal_entities"] = entities
         
-        return enhanced
+        return documents
     
     def _classify_legal_content(self, text: str) -> str:
         """Classify the type of legal content"""
-        text_lower = text.lower()
-        
-        if any(term in text_lower for term in ["section", "subsection", "paragraph"]):
-            return "structured_legal_text"
-        elif any(term in text_lower for term in ["budget", "appropriation", "funding"]):
-            return "budget_document"
-        elif any(term in text_lower for term in ["whereas", "resolved", "enacted"]):
-            return "legislative_text"
-        else:
-            return "general_legal"
+        return classify_legal_content(text)
     
     def _extract_legal_entities(self, text: str) -> List[str]:
         """Extract legal entities from text (simplified implementation)"""
-        # This is a basic implementation - in practice you'd use NER
-        entities = []
-        
-        # Look for common legal patterns
-        import re
-        
-        # Find section references
-        sections = re.findall(r'Section \d+', text, re.IGNORECASE)
-        entities.extend(sections)
-        
-        # Find dollar amounts
-        amounts = re.findall(r'\$[\d,]+(?:\.\d{2})?', text)
-        entities.extend(amounts)
-        
-        return list(set(entities))
+        return extract_legal_entities(text)
     
     def create_query_engine(self, index: VectorStoreIndex):
         """Create specialized query engine for legal documents"""
@@ -176,8 +679,8 @@ class LegalRAG(RAGSystem):
 class MultiModalLegalRAG(LegalRAG):
     """Multi-modal RAG for documents with tables, images, etc."""
     
-    def __init__(self, config: Dict = None):
-        super().__init__(config)
+    def __init__(self, config: Dict = None, cache: Optional[DocumentCache] = None):
+        super().__init__(config, cache)
     
     def build_multimodal_index(self, documents: List[Document]) -> VectorStoreIndex:
         """Build index supporting multi-modal content"""
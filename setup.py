@@ -38,6 +38,7 @@ setup(
             "pytest>=7.4.3",
             "pytest-asyncio>=0.21.1",
             "pytest-cov>=4.1.0",
+            "responses>=0.25.0",
             "black>=23.0.0",
             "flake8>=6.0.0",
             "mypy>=1.5.0",
@@ -46,6 +47,15 @@ setup(
             "fastapi>=0.104.1",
             "uvicorn>=0.24.0",
         ],
+        "faiss": [
+            "faiss-cpu>=1.7.4",
+        ],
+        "hyperscan": [
+            "hyperscan>=0.4.0",
+        ],
+        "hybrid": [
+            "rank-bm25>=0.2.2",
+        ],
     },
     entry_points={
         "console_scripts": [
@@ -0,0 +1,11 @@
+"""
+Shared fixtures for Legal-AI tests
+"""
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Keep on-disk caches created during tests out of the user's home"""
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path / "cache"))